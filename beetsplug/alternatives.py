@@ -11,30 +11,43 @@
 # all copies or substantial portions of the Software.
 
 import argparse
+import errno
 import logging
 import os.path
+import queue
 import shutil
+import stat
+import sys
 import threading
-from collections.abc import Callable, Iterator, Sequence
+from collections import deque
+from collections.abc import Callable, Collection, Iterable, Iterator, Sequence
 from concurrent import futures
 from enum import Enum
 from pathlib import Path
-from typing import Literal
+from typing import Literal, TypeVar
 
 import beets
 import confuse
-from beets import art, util
-from beets.library import Item, Library, parse_query_string
+from beets import art, dbcore, util
+from beets.dbcore.query import TrueQuery
+from beets.library import PF_KEY_DEFAULT, Album, Item, Library, parse_query_string
 from beets.plugins import BeetsPlugin
 from beets.ui import Subcommand, UserError, decargs, get_path_formats, input_yn, print_
+from beets.util.functemplate import Template
 from typing_extensions import Never, override
 
 import beetsplug.convert as convert
 
+if sys.platform == "linux":
+    import fcntl
+
+T = TypeVar("T")
+
 
 class AlternativesPlugin(BeetsPlugin):
     def __init__(self):
         super().__init__()
+        self._convert_plugin: convert.ConvertPlugin | None = None
 
     def commands(self):  # pyright: ignore[reportIncompatibleMethodOverride]
         return [AlternativesCommand(self)]
@@ -62,11 +75,18 @@ class AlternativesPlugin(BeetsPlugin):
 
         alt = self.alternative(options.name, lib)
 
-        # This is slow but we cannot use a native SQL query since the
-        # path key is a flexible attribute
-        for item in lib.items():
-            if alt.path_key in item:
-                print_(format(item))
+        for item in lib.items(_StoredQuery(alt.path_key)):
+            print_(format(item))
+
+    def convert_plugin(self) -> convert.ConvertPlugin:
+        """Returns the convert plugin instance shared by all collections.
+
+        Every `ConvertPlugin` instance registers its own event listeners, so
+        we only create one.
+        """
+        if self._convert_plugin is None:
+            self._convert_plugin = convert.ConvertPlugin()
+        return self._convert_plugin
 
     def alternative(self, name: str, lib: Library):
         config_raw = self.config[name]
@@ -78,7 +98,9 @@ class AlternativesPlugin(BeetsPlugin):
         if config.type == "link":
             return SymlinkView(self._log, lib, config)
         elif config.formats:
-            return ExternalConvert(self._log, lib, config)
+            return ExternalConvert(
+                self._log, lib, config, convert_plugin=self.convert_plugin()
+            )
         else:
             return External(self._log, lib, config)
 
@@ -161,7 +183,7 @@ class Config:
     directory: Path
     """Directory under which items in the collection are located."""
 
-    path_formats: Sequence[tuple[str, str]]
+    path_formats: Sequence[tuple[str, Template]]
     """Formats that determine the path of items in the collection. See
     <https://beets.readthedocs.io/en/stable/reference/pathformat.html>.
     """
@@ -176,6 +198,14 @@ class Config:
     album_art_maxwidth: int | None
     """Maximum width of embedded album art. Larger art is resized."""
 
+    copy_mode: "CopyMode"
+    """Determines how files that are not transcoded are added to the
+    collection."""
+
+    threads: int | None
+    """Number of files that are copied, linked or transcoded in parallel. If
+    not set, this depends on the type of the collection."""
+
     def __init__(self, collection_id: str, config: confuse.ConfigView, lib: Library):
         self.collection_id = collection_id
 
@@ -196,6 +226,18 @@ class Config:
         else:
             path_config = beets.config["paths"]
         self.path_formats = get_path_formats(path_config)
+        # `Item.destination()` parses the queries of the path formats for
+        # every item. We parse them once and select the format ourselves.
+        self._path_format_queries = [
+            (parse_query_string(query, Item)[0], path_format)
+            for query, path_format in self.path_formats
+            if query != PF_KEY_DEFAULT
+        ]
+        self._default_path_formats = [
+            (query, path_format)
+            for query, path_format in self.path_formats
+            if query == PF_KEY_DEFAULT
+        ][:1]
 
         query = config["query"].get(confuse.Optional(confuse.String(), default=""))
         self.query, _ = parse_query_string(query, Item)
@@ -231,6 +273,57 @@ class Config:
         assert isinstance(link_type, SymlinkType)
         self.link_type = link_type
 
+        copy_mode = config["copy_mode"].get(
+            confuse.Choice(
+                {
+                    "copy": CopyMode.COPY,
+                    "hardlink": CopyMode.HARDLINK,
+                },
+                default=CopyMode.COPY,
+            )
+        )
+        assert isinstance(copy_mode, CopyMode)
+        self.copy_mode = copy_mode
+
+        threads = config["threads"].get(confuse.Optional(confuse.Integer()))
+        assert threads is None or isinstance(threads, int)
+        if threads is not None and threads < 1:
+            raise confuse.ConfigValueError(
+                f"{config['threads'].name} must be a positive integer"
+            )
+        self.threads = threads
+
+    def item_path_formats(self, item: Item) -> Sequence[tuple[str, Template]]:
+        """Returns the path formats to pass to `Item.destination()`.
+
+        This only contains the format that applies to `item`, so that beets
+        does not have to match the item against all path format queries.
+        """
+        for query, path_format in self._path_format_queries:
+            if query.match(item):
+                return [(PF_KEY_DEFAULT, path_format)]
+        # Without a default format we let beets report the error.
+        return self._default_path_formats or self.path_formats
+
+
+_IO_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+"""Number of threads that check, copy or link files in a collection. The work
+is bound by file system latency, not by the CPU."""
+
+_PLAN_AHEAD = 4 * _IO_WORKERS
+"""Number of items for which actions are computed ahead of time."""
+
+_POOL_THRESHOLD = 64
+"""Number of candidate items that are checked on the calling thread before
+we start a thread pool for the remaining items."""
+
+_STORE_BATCH = 256
+"""Maximum number of modified items written to the database in one
+transaction."""
+
+_OUTPUT_BATCH = 64
+"""Maximum number of lines that are buffered before printing them."""
+
 
 class Action(Enum):
     ADD = 1
@@ -246,58 +339,188 @@ class External:
         self._config = config
         self.lib = lib
         self.path_key = f"alt.{config.collection_id}"
-        self.max_workers = int(str(beets.config["convert"]["threads"]))
+        self.max_workers = config.threads or _IO_WORKERS
+        self._created_dirs: set[Path] = set()
+        self._pending_prunes: set[Path] = set()
+        self._art_stats: dict[bytes, os.stat_result | None] = {}
+        self._albums: dict[int, Album | None] = {}
+        self._resized_arts: dict[bytes, bytes] = {}
+        self._destinations: dict[int, Path] = {}
+        self._stored_paths: dict[int, Path | None] = {}
+        self._stored_paths_loaded = False
+        self._unstored: list[Item] = []
+        self._output: list[str] = []
 
     def item_change_actions(
-        self, item: Item, actual: Path, dest: Path
+        self,
+        item: Item,
+        actual: Path,
+        actual_stat: os.stat_result,
+        dest: Path,
+        album: Album | None,
     ) -> Sequence[Action]:
         """Returns the necessary actions for items that were previously in the
         external collection, but might require metadata updates.
+
+        `actual_stat` is the result of ``lstat()`` for `actual`.
+
+        This runs on a thread pool and must not access the database.
         """
         actions = []
 
+        if stat.S_ISLNK(actual_stat.st_mode):
+            # We need the modification time of the link target. Keep the
+            # `lstat()` result if the link is broken.
+            actual_stat = _stat(actual) or actual_stat
+
         if actual != dest:
             actions.append(Action.MOVE)
 
-        item_mtime_alt = actual.stat().st_mtime
-        if item_mtime_alt < Path(str(item.path, "utf8")).stat().st_mtime:
+        item_mtime_alt = actual_stat.st_mtime
+        item_stat = os.stat(item.path)  # noqa: PTH116
+        if item_mtime_alt < item_stat.st_mtime:
             actions.append(Action.WRITE)
-        album = item.get_album()
 
-        if (
-            album
-            and album.artpath
-            and Path(str(album.artpath, "utf8")).is_file()
-            and (item_mtime_alt < Path(str(album.artpath, "utf8")).stat().st_mtime)
-        ):
-            actions.append(Action.SYNC_ART)
+        # Art is never embedded into hard links of library files.
+        if album and album.artpath and not os.path.samestat(actual_stat, item_stat):
+            art_stat = self._art_stat(album.artpath)
+            if (
+                art_stat
+                and stat.S_ISREG(art_stat.st_mode)
+                and item_mtime_alt < art_stat.st_mtime
+            ):
+                actions.append(Action.SYNC_ART)
 
         return actions
 
-    def _matched_item_action(self, item: Item) -> Sequence[Action]:
-        actual = self._get_stored_path(item)
-        if actual and (actual.is_file() or actual.is_symlink()):
-            dest = self.destination(item)
+    def _art_stat(self, artpath: bytes) -> os.stat_result | None:
+        """Returns the memoized ``stat()`` result for album art.
+
+        All items of an album share the art file, so it only needs to be
+        checked once per update. May be called from worker threads.
+        """
+        try:
+            return self._art_stats[artpath]
+        except KeyError:
+            art_stat = self._art_stats[artpath] = _stat(artpath)
+            return art_stat
+
+    def _matched_item_action(
+        self, item: Item, actual: Path | None, dest: Path, album: Album | None
+    ) -> Sequence[Action]:
+        # A single `lstat()` covers both regular files and (possibly broken)
+        # symlinks.
+        actual_stat = _stat(actual, follow_symlinks=False) if actual else None
+        mode = actual_stat.st_mode if actual_stat else 0
+        if actual and actual_stat and (stat.S_ISREG(mode) or stat.S_ISLNK(mode)):
             if actual.suffix == dest.suffix:
-                return self.item_change_actions(item, actual, dest)
+                return self.item_change_actions(item, actual, actual_stat, dest, album)
             else:
                 # formats config option changed
                 return [Action.REMOVE, Action.ADD]
         else:
             return [Action.ADD]
 
-    def _items_actions(self) -> Iterator[tuple[Item, Sequence[Action]]]:
-        matched_ids = set()
+    def _candidate_items(self) -> Iterator[tuple[Item, bool]]:
+        """Yields all items that match the collection query or that are
+        stored in the collection. The flag is true if the item matches.
+        """
+        # Collect album IDs instead of querying the items of every matched
+        # album. Membership is then checked in the same pass over the items.
+        # The query is parsed for items so albums are matched in Python.
+        # Items are fetched with a single query that SQLite can evaluate if
+        # the collection query is fast. Otherwise we fetch every item and
+        # match it in Python once. This loops over the whole library, so
+        # avoid repeated attribute lookups.
+        query = self._config.query
+        match = query.match
+        # An empty query string matches every item. There is nothing to
+        # match or partition in that case.
+        matches_all = _matches_all(query)
+        stored_paths = self._load_stored_paths()
+
+        # All albums are loaded anyway, so keep them for `_get_album()`.
+        albums = self._albums
+        matched_album_ids: set[int] = set()
         for album in self.lib.albums():
-            if self._config.query.match(album):
-                matched_items = album.items()
-                matched_ids.update(item.id for item in matched_items)
+            albums[album.id] = album
+            if not matches_all and match(album):
+                matched_album_ids.add(album.id)
+
+        if matches_all:
+            for item in self.lib.items():
+                yield (item, True)
+            return
 
-        for item in self.lib.items():
-            if item.id in matched_ids or self._config.query.match(item):
-                yield (item, self._matched_item_action(item))
-            elif self._get_stored_path(item):
-                yield (item, [Action.REMOVE])
+        if query.clause()[0] is None:
+            # beets would match the candidate query against every item in
+            # Python, and then we would match the collection query again.
+            items = self.lib.items()
+        else:
+            items = self.lib.items(
+                dbcore.OrQuery([
+                    query,
+                    _AlbumsQuery(matched_album_ids),
+                    _StoredQuery(self.path_key),
+                ])
+            )
+
+        for item in items:
+            if item.album_id in matched_album_ids or match(item):
+                yield (item, True)
+            elif stored_paths.get(item.id):
+                yield (item, False)
+
+    def _items_actions(self) -> Iterator[tuple[Item, Sequence[Action]]]:
+        """Yields the actions required for every candidate item in library
+        order. Items that are up to date are skipped.
+
+        Everything that needs the database is computed on the calling thread.
+        The file system checks in `_matched_item_action()` run on a thread pool
+        so that their latency overlaps. We look ahead a bounded number of
+        items to keep the pool busy without planning the whole library up
+        front. The pool is only started once there are more than
+        `_POOL_THRESHOLD` candidates. Small updates are planned on the calling
+        thread.
+        """
+        pool: futures.ThreadPoolExecutor | None = None
+        planned: deque[tuple[Item, futures.Future[Sequence[Action]]]] = deque()
+        try:
+            for index, (item, matched) in enumerate(self._candidate_items()):
+                if not matched:
+                    fut = _completed_future([Action.REMOVE])
+                elif pool is None and index < _POOL_THRESHOLD:
+                    fut = _completed_future(
+                        self._matched_item_action(
+                            item,
+                            self._get_stored_path(item),
+                            self.destination(item),
+                            self._get_album(item),
+                        )
+                    )
+                else:
+                    if pool is None:
+                        pool = futures.ThreadPoolExecutor(_IO_WORKERS)
+                    fut = pool.submit(
+                        self._matched_item_action,
+                        item,
+                        self._get_stored_path(item),
+                        self.destination(item),
+                        self._get_album(item),
+                    )
+                planned.append((item, fut))
+
+                if len(planned) > _PLAN_AHEAD:
+                    item, fut = planned.popleft()
+                    if actions := fut.result():
+                        yield (item, actions)
+
+            for item, fut in planned:
+                if actions := fut.result():
+                    yield (item, actions)
+        finally:
+            if pool is not None:
+                pool.shutdown()
 
     def ask_create(self, create: bool | None = None) -> bool:
         if not self._config.removable:
@@ -317,97 +540,299 @@ class External:
             print_(f"Skipping creation of {self._config.directory}")
             return
 
+        self._clear_caches()
         converter = self._converter()
-        for item, actions in self._items_actions():
-            dest = self.destination(item)
-            path = self._get_stored_path(item)
-            for action in actions:
-                if action == Action.MOVE:
-                    assert path is not None  # action guarantees that `path` is not none
-                    print_(f">{path} -> {dest}")
-                    dest.parent.mkdir(parents=True, exist_ok=True)
-                    path.rename(dest)
-                    # beets types are confusing
-                    util.prune_dirs(str(path.parent), root=str(self._config.directory))  # pyright: ignore
-                    self._set_stored_path(item, dest)
-                    item.store()
-                    path = dest
-                elif action == Action.WRITE:
-                    assert path is not None  # action guarantees that `path` is not none
-                    print_(f"*{path}")
-                    item.write(path=bytes(path))
-                elif action == Action.SYNC_ART:
-                    print_(f"~{path}")
-                    assert path is not None
-                    self._sync_art(item, path)
-                elif action == Action.ADD:
-                    print_(f"+{dest}")
-                    converter.run(item)
-                elif action == Action.REMOVE:
-                    assert path is not None  # action guarantees that `path` is not none
-                    print_(f"-{path}")
-                    self._remove_file(item)
-                    item.store()
-
-        for item, dest in converter.as_completed():
-            self._set_stored_path(item, dest)
-            item.store()
+        try:
+            for item, actions in self._items_actions():
+                path = self._get_stored_path(item)
+                for action in actions:
+                    if action == Action.MOVE:
+                        # action guarantees that `path` is not none
+                        assert path is not None
+                        dest = self.destination(item)
+                        self._print(f">{path} -> {dest}")
+                        self._ensure_dir(dest.parent)
+                        path.rename(dest)
+                        self._prune_dirs(path.parent)
+                        self._set_stored_path(item, dest)
+                        self._store(item)
+                        path = dest
+                    elif action == Action.WRITE:
+                        # action guarantees that `path` is not none
+                        assert path is not None
+                        self._print(f"*{path}")
+                        item.write(path=bytes(path))
+                    elif action == Action.SYNC_ART:
+                        self._print(f"~{path}")
+                        assert path is not None
+                        self._sync_art(item, path)
+                    elif action == Action.ADD:
+                        dest = self.destination(item)
+                        self._print(f"+{dest}")
+                        converter.run(item, dest)
+                    elif action == Action.REMOVE:
+                        # action guarantees that `path` is not none
+                        assert path is not None
+                        self._print(f"-{path}")
+                        self._remove_file(item)
+                        self._store(item)
+
+                # Record finished conversions while we are still planning
+                # so that they are not lost if the update is interrupted.
+                self._store_converted(converter.completed())
+
+            # Show all planned changes before waiting for the converter.
+            self._flush_output()
+            self._store_converted(converter.as_completed())
+            self._flush_prunes()
+        finally:
+            # Record everything that has been done, even if the update fails.
+            self._flush_stores()
+            self._flush_output()
         converter.shutdown()
 
     def destination(self, item: Item) -> Path:
-        """Returns the path for `item` in the external collection."""
-        path = item.destination(path_formats=self._config.path_formats, fragment=True)
-        # When using `fragment=True` the returned path is guaranteed to be a
-        # string.
+        """Returns the path for `item` in the external collection.
+
+        Evaluating the path formats is expensive and the destination is
+        needed several times per item, so the result is memoized for the
+        duration of an update.
+        """
+        dest = self._destinations.get(item.id)
+        if dest is None:
+            dest = self._destinations[item.id] = self._item_destination(item)
+        return dest
+
+    def _item_destination(self, item: Item) -> Path:
+        """Computes the uncached result of `destination()`."""
+        path = item.destination(
+            path_formats=self._config.item_path_formats(item), fragment=True
+        )
+        # When using `fragment=True` the returned path is guaranteed to be
+        # a string.
         assert isinstance(path, str)
         return self._config.directory / path
 
+    def _store_converted(self, results: Iterable[tuple[Item, Path]]):
+        """Records the destinations of converted items."""
+        for item, dest in results:
+            self._set_stored_path(item, dest)
+            self._store(item)
+
+    def _clear_caches(self):
+        """Forget file system and item state memoized by a previous update."""
+        self._created_dirs.clear()
+        self._pending_prunes.clear()
+        self._art_stats.clear()
+        self._albums.clear()
+        self._resized_arts.clear()
+        self._destinations.clear()
+        self._stored_paths.clear()
+        self._stored_paths_loaded = False
+
     def _set_stored_path(self, item: Item, path: Path):
         item[self.path_key] = str(path)
+        self._stored_paths[item.id] = path
 
-    def _get_stored_path(self, item: Item) -> Path | None:
+    def _get_album(self, item: Item) -> Album | None:
+        """Returns the album of `item`.
+
+        Albums are memoized for the duration of an update, so that the
+        tracks of an album do not query the database one by one.
+        """
+        if item.album_id is None:
+            return None
         try:
-            path = item[self.path_key]
+            return self._albums[item.album_id]
         except KeyError:
-            return None
+            album = self._albums[item.album_id] = item.get_album()
+            return album
 
-        if isinstance(path, str):
-            return Path(path)
-        else:
+    def _load_stored_paths(self) -> dict[int, Path | None]:
+        """Reads the stored paths of all items in the collection with a
+        single query and memoizes them for `_get_stored_path()`.
+        """
+        with self.lib.transaction() as tx:
+            rows = tx.query(
+                "SELECT entity_id, value FROM item_attributes WHERE key = ?",
+                (self.path_key,),
+            )
+        self._stored_paths.update(
+            (item_id, Path(value) if isinstance(value, str) else None)
+            for item_id, value in rows
+        )
+        self._stored_paths_loaded = True
+        return self._stored_paths
+
+    def _get_stored_path(self, item: Item) -> Path | None:
+        # The stored path is read several times per item. Memoize the
+        # decoded `Path` so we only construct it once.
+        if item.id in self._stored_paths:
+            return self._stored_paths[item.id]
+        # Items without a stored path have no row in the loaded map.
+        if self._stored_paths_loaded:
             return None
 
+        # The path is a flexible attribute of the item, never of the album.
+        value = item.get(self.path_key, with_album=False)
+        path = Path(value) if isinstance(value, str) else None
+        self._stored_paths[item.id] = path
+        return path
+
     def _remove_file(self, item: Item):
         """Remove the external file for `item`."""
         path = self._get_stored_path(item)
         if path:
             path.unlink(missing_ok=True)
+            self._prune_dirs(path.parent)
+        del item[self.path_key]
+        self._stored_paths[item.id] = None
+
+    def _store(self, item: Item):
+        """Write `item` to the database.
+
+        Writes are deferred and grouped into transactions of `_STORE_BATCH`
+        items to avoid committing (and syncing) the database for every
+        single item. Call `_flush_stores()` to write all pending items.
+
+        The database lock is only held while writing a batch so that other
+        threads are not blocked for the whole update.
+        """
+        self._unstored.append(item)
+        if len(self._unstored) >= _STORE_BATCH:
+            self._flush_stores()
+
+    def _flush_stores(self):
+        """Write all items passed to `_store()` in a single transaction."""
+        if not self._unstored:
+            return
+        with self.lib.transaction():
+            for item in self._unstored:
+                item.store()
+        self._unstored.clear()
+
+    def _print(self, line: str):
+        """Print `line` to the console.
+
+        Lines are buffered and written in batches of `_OUTPUT_BATCH` to avoid
+        a write to the terminal for every item. Call `_flush_output()` to
+        write the remaining lines.
+        """
+        self._output.append(line)
+        if len(self._output) >= _OUTPUT_BATCH:
+            self._flush_output()
+
+    def _flush_output(self):
+        if self._output:
+            print_("\n".join(self._output))
+            self._output.clear()
+
+    def _ensure_dir(self, path: Path):
+        """Create the directory `path` and its parents unless this has
+        already been done during the current update.
+
+        May be called from worker threads. Concurrent calls for the same
+        directory are harmless.
+        """
+        if path not in self._created_dirs:
+            path.mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(path)
+
+    def _prune_dirs(self, path: Path):
+        """Remove empty directories from `path` upwards to the collection
+        directory.
+
+        Many files are usually removed from the same directory, so this is
+        deferred until `_flush_prunes()` is called and every directory is
+        only checked once.
+        """
+        self._pending_prunes.add(path)
+
+    def _flush_prunes(self):
+        # Prune nested directories first so that their parents are empty
+        # when we get to them.
+        for path in sorted(
+            self._pending_prunes, key=lambda path: len(path.parts), reverse=True
+        ):
             # beets types are confusing
             util.prune_dirs(str(path), root=str(self._config.directory))  # pyright: ignore
-        del item[self.path_key]
+            # Pruned directories must be created again if they are needed later.
+            self._created_dirs.difference_update([path, *path.parents])
+        self._pending_prunes.clear()
 
     def _converter(self) -> "Worker":
-        def _convert(item: Item):
-            dest = self.destination(item)
-            dest.parent.mkdir(exist_ok=True, parents=True)
-            shutil.copyfile(item.path, dest)
+        def _convert(item: Item, dest: Path):
+            self._ensure_dir(dest.parent)
+            self._add_file(item.path, dest)
             return item, dest
 
-        return Worker(_convert, self.max_workers)
+        return Worker(_convert, self.max_workers, on_block=self._flush_output)
+
+    def _add_file(self, src: bytes, dest: Path):
+        """Adds the file `src` to the collection at `dest` without
+        transcoding it.
+
+        With the `hardlink` copy mode we fall back to copying if `src` and
+        `dest` are on different file systems or hard links are not supported.
+        """
+        if self._config.copy_mode == CopyMode.HARDLINK:
+            try:
+                _link_file(src, dest)
+                return
+            except OSError as e:
+                if e.errno not in _LINK_UNSUPPORTED:
+                    raise
+        _copy_file(src, dest)
 
     def _sync_art(self, item: Item, path: Path):
-        """Embed artwork in the file at `path`."""
-        album = item.get_album()
-        if album and album.artpath and Path(str(album.artpath, "utf8")).is_file():
+        """Embed artwork in the file at `path`.
+
+        Nothing is embedded if `path` is a hard link of the library file.
+        Otherwise we would modify the library file.
+        """
+        if self._config.copy_mode == CopyMode.HARDLINK and _is_same_file(
+            path, item.path
+        ):
+            self._log.debug(f"Not embedding art into hard link {path}")
+            return
+
+        album = self._get_album(item)
+        if (
+            album
+            and album.artpath
+            and (art_stat := self._art_stat(album.artpath))
+            and stat.S_ISREG(art_stat.st_mode)
+        ):
             self._log.debug(f"Embedding art from {album.artpath} into {path}")
 
             art.embed_item(
                 self._log,
                 item,
-                album.artpath,
-                maxwidth=self._config.album_art_maxwidth,
+                self._resized_art(album.artpath),
                 itempath=bytes(path),
             )
 
+    def _resized_art(self, artpath: bytes) -> bytes:
+        """Returns the path of the art to embed for `artpath`.
+
+        If `album_art_maxwidth` is set the art is resized only once per
+        update and shared by all items of the album. May be called from
+        worker threads.
+        """
+        maxwidth = self._config.album_art_maxwidth
+        if not maxwidth:
+            return artpath
+        try:
+            return self._resized_arts[artpath]
+        except KeyError:
+            # Without a local image backend beets returns the original path
+            # as a `str`.
+            resized = util.bytestring_path(
+                art.resize_image(self._log, artpath, maxwidth, 0)
+            )
+            self._resized_arts[artpath] = resized
+            return resized
+
 
 class ExternalConvert(External):
     def __init__(
@@ -415,39 +840,44 @@ class ExternalConvert(External):
         log: logging.Logger,
         lib: Library,
         config: Config,
+        convert_plugin: convert.ConvertPlugin | None = None,
     ):
         super().__init__(log, lib, config)
-        convert_plugin = convert.ConvertPlugin()
+        # Transcoding is bound by the CPU.
+        self.max_workers = config.threads or int(
+            str(beets.config["convert"]["threads"])
+        )
+        if convert_plugin is None:
+            convert_plugin = convert.ConvertPlugin()
         self._encode = convert_plugin.encode
         self._embed = convert_plugin.config["embed"].get(bool)
-        self._formats = [convert.ALIASES.get(f, f) for f in config.formats]
-        self.convert_cmd, self.ext = convert.get_format(self._formats[0])
+        formats = [convert.ALIASES.get(f, f) for f in config.formats]
+        # Checked for every item, so use a set
+        self._formats = frozenset(formats)
+        self.convert_cmd, self.ext = convert.get_format(formats[0])
 
     @override
     def _converter(self) -> "Worker":
-        fs_lock = threading.Lock()
-
-        def _convert(item: Item):
-            dest = self.destination(item)
-            with fs_lock:
-                dest.parent.mkdir(exist_ok=True, parents=True)
+        def _convert(item: Item, dest: Path):
+            self._ensure_dir(dest.parent)
 
             if self._should_transcode(item):
-                self._encode(self.convert_cmd, item.path, bytes(dest))
+                dest_bytes = bytes(dest)
+                self._encode(self.convert_cmd, item.path, dest_bytes)
                 # Don't rely on the converter to write correct/complete tags.
-                item.write(path=bytes(dest))
+                item.write(path=dest_bytes)
             else:
                 self._log.debug(f"copying {dest}")
-                shutil.copyfile(item.path, dest)
+                self._add_file(item.path, dest)
             if self._embed:
                 self._sync_art(item, dest)
             return item, dest
 
-        return Worker(_convert, self.max_workers)
+        return Worker(_convert, self.max_workers, on_block=self._flush_output)
 
     @override
-    def destination(self, item: Item) -> Path:
-        dest = super().destination(item)
+    def _item_destination(self, item: Item) -> Path:
+        dest = super()._item_destination(item)
         if self._should_transcode(item):
             return dest.with_suffix("." + self.ext.decode("utf8"))
         else:
@@ -457,6 +887,11 @@ class ExternalConvert(External):
         return item.format.lower() not in self._formats
 
 
+class CopyMode(Enum):
+    COPY = 0
+    HARDLINK = 1
+
+
 class SymlinkType(Enum):
     ABSOLUTE = 0
     RELATIVE = 1
@@ -465,75 +900,337 @@ class SymlinkType(Enum):
 class SymlinkView(External):
     @override
     def item_change_actions(
-        self, item: Item, actual: Path, dest: Path
+        self,
+        item: Item,
+        actual: Path,
+        actual_stat: os.stat_result,
+        dest: Path,
+        album: Album | None,
     ) -> Sequence[Action]:
         """Returns the necessary actions for items that were previously in the
         external collection, but might require metadata updates.
+
+        Comparing the link text with the link we would create only needs a
+        single ``readlink()`` and no access to the link target.
         """
 
-        if (
-            actual == dest
-            and actual.is_file()  # Symlink not broken, `.samefile()` doesn’t throw
-            and actual.samefile(Path(str(item.path, "utf8")))
-        ):
+        if actual != dest or not stat.S_ISLNK(actual_stat.st_mode):
+            return [Action.MOVE]
+        try:
+            link = actual.readlink()
+        except OSError:
+            # The link disappeared since we checked it
+            return [Action.MOVE]
+        if link == Path(self._link_target(item, dest)):
             return []
         else:
             return [Action.MOVE]
 
     @override
     def update(self, create: bool | None = None):
-        for item, actions in self._items_actions():
-            dest = self.destination(item)
-            path = self._get_stored_path(item)
-            for action in actions:
-                if action == Action.MOVE:
-                    assert path is not None  # action guarantees that `path` is not none
-                    print_(f">{path} -> {dest}")
-                    self._remove_file(item)
-                    self._create_symlink(item)
-                    self._set_stored_path(item, dest)
-                elif action == Action.ADD:
-                    print_(f"+{dest}")
-                    self._create_symlink(item)
-                    self._set_stored_path(item, dest)
-                elif action == Action.REMOVE:
-                    assert path is not None  # action guarantees that `path` is not none
-                    print_(f"-{path}")
-                    self._remove_file(item)
-                else:
-                    continue
-                item.store()
+        self._clear_caches()
+        linker = self._converter()
+        try:
+            for item, actions in self._items_actions():
+                path = self._get_stored_path(item)
+                for action in actions:
+                    if action == Action.MOVE:
+                        # action guarantees that `path` is not none
+                        assert path is not None
+                        dest = self.destination(item)
+                        self._print(f">{path} -> {dest}")
+                        self._remove_file(item)
+                        linker.run(item, dest)
+                    elif action == Action.ADD:
+                        dest = self.destination(item)
+                        self._print(f"+{dest}")
+                        linker.run(item, dest)
+                    elif action == Action.REMOVE:
+                        # action guarantees that `path` is not none
+                        assert path is not None
+                        self._print(f"-{path}")
+                        self._remove_file(item)
+                        self._store(item)
+
+                self._store_converted(linker.completed())
+
+            self._flush_output()
+            self._store_converted(linker.as_completed())
+            self._flush_prunes()
+        finally:
+            self._flush_stores()
+            self._flush_output()
+
+        linker.shutdown()
 
-    def _create_symlink(self, item: Item):
-        dest = self.destination(item)
-        dest.parent.mkdir(exist_ok=True, parents=True)
-        item_path = Path(str(item.path, "utf8"))
-        link = (
-            os.path.relpath(item_path, dest.parent)
-            if self._config.link_type == SymlinkType.RELATIVE
-            else item_path
+    @override
+    def _converter(self) -> "Worker":
+        """Creates symlinks on a thread pool so that the latency of the
+        file system operations overlaps.
+        """
+        return Worker(
+            self._create_symlink, self.max_workers, on_block=self._flush_output
         )
-        dest.symlink_to(link)
+
+    def _create_symlink(self, item: Item, dest: Path):
+        self._ensure_dir(dest.parent)
+        dest.symlink_to(self._link_target(item, dest))
+        return item, dest
+
+    def _link_target(self, item: Item, dest: Path) -> str:
+        """Returns the content of the symlink at `dest` that points to the
+        file of `item`.
+        """
+        item_path = Path(str(item.path, "utf8"))
+        if self._config.link_type == SymlinkType.RELATIVE:
+            return os.path.relpath(item_path, dest.parent)
+        else:
+            return str(item_path)
 
     @override
     def _sync_art(self, item: Item, path: Path):
         pass
 
 
-class Worker(futures.ThreadPoolExecutor):
+def _stat(path: Path | bytes, *, follow_symlinks: bool = True) -> os.stat_result | None:
+    """Return the ``os.stat()`` result for `path` or ``None`` if the file
+    cannot be accessed.
+    """
+    try:
+        return os.stat(path, follow_symlinks=follow_symlinks)  # noqa: PTH116
+    except OSError:
+        return None
+
+
+_COPY_FILE_RANGE_UNSUPPORTED = frozenset({
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+})
+"""Errors from ``os.copy_file_range()`` after which we fall back to a regular
+copy."""
+
+_FICLONE = 0x40049409
+"""Linux ``ioctl()`` request that makes a file share the data blocks of
+another file (a reflink)."""
+
+_CLONE_UNSUPPORTED = _COPY_FILE_RANGE_UNSUPPORTED | {errno.ENOTTY}
+"""Errors from the ``FICLONE`` request after which we copy the data instead."""
+
+
+_LINK_UNSUPPORTED = frozenset({
+    errno.EXDEV,
+    errno.EPERM,
+    errno.EMLINK,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+})
+"""Errors from ``os.link()`` after which we copy the file instead."""
+
+
+def _link_file(src: bytes, dest: Path):
+    """Create a hard link of `src` at `dest`.
+
+    Unlike copying, ``os.link()`` does not replace an existing file at `dest`,
+    so we remove it and try again.
+    """
+    try:
+        os.link(src, dest)
+    except FileExistsError:
+        dest.unlink()
+        os.link(src, dest)
+
+
+def _copy_file(src: bytes, dest: Path):
+    """Copy the contents of the file `src` to `dest`.
+
+    On copy-on-write file systems (like btrfs or XFS) we first try to clone
+    the file so that it shares the data blocks with `src`. Otherwise the
+    data is copied with ``os.copy_file_range()`` where available. The kernel
+    then copies without passing the data through user space. If that is not
+    supported we fall back to ``shutil.copyfile()``, which uses
+    ``sendfile()`` where it can.
+    """
+    if sys.platform == "linux":
+        try:
+            with Path(os.fsdecode(src)).open("rb") as fsrc, dest.open("wb") as fdst:
+                try:
+                    fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+                    return
+                except OSError as e:
+                    if e.errno not in _CLONE_UNSUPPORTED:
+                        raise
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        # Some file systems report success without copying
+                        # anything. Treat this as if the call was unsupported.
+                        raise OSError(errno.ENOTSUP, os.strerror(errno.ENOTSUP))
+                    remaining -= copied
+            return
+        except OSError as e:
+            if e.errno not in _COPY_FILE_RANGE_UNSUPPORTED:
+                raise
+
+    shutil.copyfile(src, dest)
+
+
+class _AlbumsQuery(dbcore.Query):
+    """Matches items that belong to one of the given albums."""
+
+    def __init__(self, album_ids: Collection[int]):
+        self.album_ids = frozenset(album_ids)
+
+    @override
+    def clause(self):
+        # Album IDs are integers from the database. We inline them because
+        # there may be more than SQLite allows for bound parameters.
+        album_ids = ", ".join(str(int(album_id)) for album_id in self.album_ids)
+        return f"items.album_id IN ({album_ids})", ()
+
+    @override
+    def match(self, obj: dbcore.Model) -> bool:
+        return obj.get("album_id") in self.album_ids
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({sorted(self.album_ids)!r})"
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            super().__eq__(other)
+            and isinstance(other, _AlbumsQuery)
+            and self.album_ids == other.album_ids
+        )
+
+    def __hash__(self) -> int:
+        return hash(self.album_ids)
+
+
+class _StoredQuery(dbcore.Query):
+    """Matches items that have the flexible attribute `path_key`, i.e. that are
+    stored in the collection.
+    """
+
+    def __init__(self, path_key: str):
+        self.path_key = path_key
+
+    @override
+    def clause(self):
+        return (
+            "items.id IN (SELECT entity_id FROM item_attributes WHERE key = ?)",
+            [self.path_key],
+        )
+
+    @override
+    def match(self, obj: dbcore.Model) -> bool:
+        return self.path_key in obj
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.path_key!r})"
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            super().__eq__(other)
+            and isinstance(other, _StoredQuery)
+            and self.path_key == other.path_key
+        )
+
+    def __hash__(self) -> int:
+        return hash(self.path_key)
+
+
+def _is_same_file(path: Path, other: bytes) -> bool:
+    """Returns true if `path` and `other` refer to the same existing file."""
+    path_stat = _stat(path)
+    other_stat = _stat(other)
+    return bool(path_stat and other_stat and os.path.samestat(path_stat, other_stat))
+
+
+def _matches_all(query: dbcore.Query) -> bool:
+    """Returns true if `query` is known to match every item.
+
+    Depending on the beets version the empty query string is parsed to an
+    `AndQuery` without subqueries or with a single `TrueQuery`.
+    """
+    if isinstance(query, TrueQuery):
+        return True
+    return isinstance(query, dbcore.AndQuery) and all(
+        isinstance(subquery, TrueQuery) for subquery in query.subqueries
+    )
+
+
+def _completed_future(result: T) -> futures.Future[T]:
+    fut: futures.Future[T] = futures.Future()
+    fut.set_result(result)
+    return fut
+
+
+class Worker:
+    """Runs `fn` for items and their destinations on a thread pool and
+    yields the results in the order in which they complete.
+    """
+
     def __init__(
-        self, fn: Callable[[Item], tuple[Item, Path]], max_workers: int | None
+        self,
+        fn: Callable[[Item, Path], tuple[Item, Path]],
+        max_workers: int | None,
+        on_block: Callable[[], None] | None = None,
     ):
-        super().__init__(max_workers)
-        self._tasks: set[futures.Future[tuple[Item, Path]]] = set()
+        self._executor = futures.ThreadPoolExecutor(max_workers)
+        # Bounds the number of jobs that have been submitted but not finished
+        # so that we don’t queue up the whole collection in memory.
+        self._slots = threading.BoundedSemaphore(
+            2 * (max_workers or os.cpu_count() or 1)
+        )
         self._fn = fn
+        self._on_block = on_block
+        # Futures put themselves on this queue when they are done so that
+        # consumers never need to scan or lock the pending tasks.
+        self._done: queue.SimpleQueue[futures.Future[tuple[Item, Path]]] = (
+            queue.SimpleQueue()
+        )
+        self._pending = 0
+
+    def run(self, item: Item, dest: Path):
+        """Submits a job. Blocks while the maximum number of jobs are
+        running or waiting to run.
 
-    def run(self, item: Item):
-        fut = self.submit(self._fn, item)
-        self._tasks.add(fut)
+        `on_block` is called before blocking, so that the caller can, for
+        example, show buffered output while it waits.
+        """
+        if not self._slots.acquire(blocking=False):
+            if self._on_block is not None:
+                self._on_block()
+            self._slots.acquire()
+        fut = self._executor.submit(self._fn, item, dest)
+        self._pending += 1
+        fut.add_done_callback(self._job_done)
         return fut
 
+    def _job_done(self, fut: futures.Future[tuple[Item, Path]]):
+        self._slots.release()
+        self._done.put(fut)
+
     def as_completed(self):
-        for f in futures.as_completed(self._tasks):
-            self._tasks.remove(f)
-            yield f.result()
+        while self._pending:
+            fut = self._done.get()
+            self._pending -= 1
+            yield fut.result()
+
+    def completed(self):
+        """Like `as_completed()` but only yields the results that are
+        already available instead of waiting for pending jobs.
+        """
+        while self._pending:
+            try:
+                fut = self._done.get_nowait()
+            except queue.Empty:
+                return
+            self._pending -= 1
+            yield fut.result()
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait)
@@ -1,8 +1,11 @@
+# pyright: reportPrivateUsage=false
+import errno
 import os
 import os.path
 import platform
 import shutil
 import sys
+import threading
 from pathlib import Path
 from time import sleep
 
@@ -13,6 +16,8 @@ from beets.util.artresizer import ArtResizer
 from confuse import ConfigValueError
 from mediafile import MediaFile
 
+import beetsplug.alternatives as alternatives
+
 from .helper import (
     TestHelper,
     assert_file_tag,
@@ -189,6 +194,38 @@ class TestSymlinkView(TestHelper):
             absolute=True,
         )
 
+    def test_change_link_type(self):
+        """Links are recreated when the link type changes"""
+
+        self.add_album(artist="Michael Jackson", album="Thriller", year="1990")
+        alt_path = self.libdir / "by-year/1990/Thriller/track 1.mp3"
+        library_path = self.libdir / "Michael Jackson/Thriller/track 1.mp3"
+
+        self.alt_config["link_type"] = "absolute"
+        self.runcli("alt", "update", "by-year")
+        assert_symlink(alt_path, library_path, absolute=True)
+
+        self.alt_config["link_type"] = "relative"
+        out = self.runcli("alt", "update", "by-year")
+        assert f">{alt_path} -> {alt_path}" in out
+        assert_symlink(alt_path, library_path, absolute=False)
+
+    def test_vanished_link(self):
+        """A link that disappears while it is checked is created again"""
+
+        album = self.add_album(artist="Michael Jackson", album="Thriller", year="1990")
+        self.runcli("alt", "update", "by-year")
+        item = album.items().get()
+        assert item
+        alt_path = self.libdir / "by-year/1990/Thriller/track 1.mp3"
+        link_stat = alt_path.lstat()
+        alt_path.unlink()
+
+        plugin = alternatives.AlternativesPlugin()
+        view = plugin.alternative("by-year", self.lib)
+        actions = view.item_change_actions(item, alt_path, link_stat, alt_path, album)
+        assert actions == [alternatives.Action.MOVE]
+
     def test_invalid_link_type(self):
         self.alt_config["link_type"] = "Hylian"
 
@@ -225,6 +262,142 @@ class TestExternalCopy(TestHelper):
         for item in album.items():
             assert self.get_path(item).is_file()
 
+    def test_add_hardlink(self):
+        self.external_config["copy_mode"] = "hardlink"
+        item = self.add_external_track("myexternal")
+        assert self.get_path(item).samefile(str(item.path, "utf8"))
+
+    def test_add_hardlink_fallback_to_copy(self, monkeypatch: pytest.MonkeyPatch):
+        def link(src: bytes, dst: Path):
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+        monkeypatch.setattr(os, "link", link)
+        self.external_config["copy_mode"] = "hardlink"
+        item = self.add_external_track("myexternal")
+        path = self.get_path(item)
+        assert path.is_file()
+        assert not path.samefile(str(item.path, "utf8"))
+
+    @pytest.mark.skipif(
+        not hasattr(os, "copy_file_range"), reason="requires os.copy_file_range"
+    )
+    @pytest.mark.parametrize("failure", ["exdev", "no_progress"])
+    def test_add_copy_file_range_fallback(
+        self, monkeypatch: pytest.MonkeyPatch, failure: str
+    ):
+        calls: list[int] = []
+
+        def copy_file_range(src: int, dst: int, count: int) -> int:
+            calls.append(count)
+            if failure == "exdev":
+                raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+            return 0
+
+        def ioctl(fd: int, request: int, arg: int) -> int:
+            raise OSError(errno.EOPNOTSUPP, os.strerror(errno.EOPNOTSUPP))
+
+        # Make sure we do not clone the file on copy-on-write file systems.
+        monkeypatch.setattr("fcntl.ioctl", ioctl)
+        monkeypatch.setattr(os, "copy_file_range", copy_file_range)
+        item = self.add_external_track("myexternal")
+        path = self.get_path(item)
+        assert calls
+        assert path.stat().st_size > 0
+        assert MediaFile(path).title == item.title
+
+    def test_add_hardlink_replaces_existing_file(self):
+        item = self.add_external_track("myexternal")
+        path = self.get_path(item)
+        assert not path.samefile(str(item.path, "utf8"))
+
+        self.external_config["copy_mode"] = "hardlink"
+        del item["alt.myexternal"]
+        item.store()
+        self.runcli("alt", "update", "myexternal")
+
+        assert path.samefile(str(item.path, "utf8"))
+
+    @pytest.mark.skipif(sys.platform != "linux", reason="reflinks require Linux")
+    def test_add_reflink(self, monkeypatch: pytest.MonkeyPatch):
+        requests: list[int] = []
+
+        def ioctl(fd: int, request: int, arg: int) -> int:
+            requests.append(request)
+            # Emulate the clone on file systems without reflinks.
+            os.write(fd, os.pread(arg, os.fstat(arg).st_size, 0))
+            return 0
+
+        def copy_file_range(src: int, dst: int, count: int) -> int:
+            raise AssertionError("Cloned files must not be copied")
+
+        monkeypatch.setattr("fcntl.ioctl", ioctl)
+        monkeypatch.setattr(os, "copy_file_range", copy_file_range)
+        item = self.add_external_track("myexternal")
+        path = self.get_path(item)
+        assert requests == [alternatives._FICLONE]
+        assert MediaFile(path).title == item.title
+
+    def test_hardlink_sync_art_keeps_library_file(self, tmp_path: Path):
+        self.external_config["copy_mode"] = "hardlink"
+        album = self.add_external_album("myexternal")
+        item = album.items().get()
+        assert item
+        library_path = Path(str(item.path, "utf8"))
+        library_content = library_path.read_bytes()
+        library_mtime = library_path.stat().st_mtime
+
+        image_path = tmp_path / "image.png"
+        shutil.copy(self.IMAGE_FIXTURE1, image_path)
+        os.utime(image_path, (library_mtime + 2, library_mtime + 2))
+        album.artpath = bytes(image_path)
+        album.store()
+        self.runcli("alt", "update", "myexternal")
+
+        assert library_path.read_bytes() == library_content
+        assert library_path.stat().st_mtime == library_mtime
+        assert_has_not_embedded_artwork(library_path)
+
+    def test_empty_query_matches_all(self, monkeypatch: pytest.MonkeyPatch):
+        def albums_query(*args: object):
+            raise AssertionError("Empty query must not match albums")
+
+        monkeypatch.setattr("beetsplug.alternatives._AlbumsQuery", albums_query)
+        self.external_config["query"] = ""
+        album = self.add_album()
+        track = self.add_track()
+        self.runcli("alt", "update", "myexternal")
+
+        for item in [*album.items(), track]:
+            item.load()
+            assert self.get_path(item).is_file()
+
+    def test_threads(self):
+        self.external_config["threads"] = 2
+        plugin = alternatives.AlternativesPlugin()
+        assert plugin.alternative("myexternal", self.lib).max_workers == 2
+
+    def test_invalid_threads(self):
+        self.external_config["threads"] = 0
+        with pytest.raises(ConfigValueError):
+            self.runcli("alt", "update", "myexternal")
+
+    def test_slow_query_matches_once(self, monkeypatch: pytest.MonkeyPatch):
+        def stored_query(*args: object):
+            raise AssertionError("Slow queries must not be combined")
+
+        monkeypatch.setattr("beetsplug.alternatives._StoredQuery", stored_query)
+        item = self.add_external_track("myexternal")
+        album = self.add_album(myexternal="true")
+        self.runcli("alt", "update", "myexternal")
+        for album_item in album.items():
+            assert self.get_path(album_item).is_file()
+
+        item["myexternal"] = "false"
+        item.store()
+        path = self.get_path(item)
+        self.runcli("alt", "update", "myexternal")
+        assert not path.exists()
+
     def test_add_nonexistent(self):
         item = self.add_external_track("myexternal")
         path = self.get_path(item)
@@ -279,6 +452,21 @@ class TestExternalCopy(TestHelper):
         assert_is_not_file(old_path)
         assert new_path.is_file()
 
+    def test_path_format_query(self):
+        self.external_config["paths"] = {
+            "default": "$album/$title",
+            "title:special": "special/$title",
+        }
+        item = self.add_external_track("myexternal")
+        assert self.get_path(item).parent.name == item.album
+
+        item["title"] = "special title"
+        item.store()
+        self.runcli("alt", "update", "myexternal")
+
+        item.load()
+        assert self.get_path(item).parent.name == "special"
+
     def test_move_and_write_after_tags_changed(self):
         item = self.add_external_track("myexternal")
         old_path = self.get_path(item)
@@ -337,6 +525,24 @@ class TestExternalCopy(TestHelper):
         assert "alt.myexternal" not in item
         assert_is_not_file(old_path)
 
+    def test_plan_on_thread_pool(self, monkeypatch: pytest.MonkeyPatch):
+        """Items are checked on a thread pool for large updates."""
+        monkeypatch.setattr("beetsplug.alternatives._POOL_THRESHOLD", 0)
+        items = [self.add_external_track("myexternal", title=f"t{i}") for i in range(3)]
+        old_path = self.get_path(items[0])
+
+        sleep(0.1)
+        items[0]["title"] = "a new title"
+        items[0].store()
+        items[0].write()
+        out = self.runcli("alt", "update", "myexternal")
+        assert out.count("\n") == 2  # MOVE and WRITE for one item only
+
+        items[0].load()
+        new_path = self.get_path(items[0])
+        assert_is_not_file(old_path)
+        assert MediaFile(new_path).title == "a new title"
+
     def test_unkown_collection(self):
         with pytest.raises(UserError) as e:
             self.runcli("alt", "update", "unkown")
@@ -495,6 +701,20 @@ class TestExternalConvert(TestHelper):
         assert item
         assert_has_embedded_artwork(self.get_path(item))
 
+    def test_copy_hardlink_does_not_embed(self):
+        self.config["convert"]["embed"] = True
+        self.external_config["copy_mode"] = "hardlink"
+
+        album = self.add_album(myexternal="true", format="ogg")
+        album.artpath = bytes(self.IMAGE_FIXTURE1)
+        album.store()
+
+        self.runcli("alt", "update", "myexternal")
+        item = album.items().get()
+        assert item
+        assert self.get_path(item).samefile(str(item.path, "utf8"))
+        assert_has_not_embedded_artwork(self.get_path(item))
+
     def test_convert_write_tags(self):
         item = self.add_track(myexternal="true", format="m4a", title="TITLE")
 
@@ -580,6 +800,45 @@ class TestExternalConvertWorker(TestHelper):
             converted_path = self.get_path(item)
             assert_media_file_fields(converted_path, type="ogg", title=item.title)
 
+    def test_flush_output_before_blocking(self, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.undo()
+        release = threading.Event()
+        blocked: list[int] = []
+
+        def fn(item: Item, dest: Path):
+            release.wait()
+            return item, dest
+
+        def on_block():
+            blocked.append(len(blocked))
+            release.set()
+
+        worker = alternatives.Worker(fn, 1, on_block=on_block)
+        item = Item()
+        worker.run(item, Path("a"))
+        worker.run(item, Path("b"))
+        assert blocked == []
+        worker.run(item, Path("c"))
+        assert blocked == [0]
+        assert len(list(worker.as_completed())) == 3
+        worker.shutdown()
+
+
+class TestCandidateQueries:
+    def test_stored_query_equality(self):
+        query = alternatives._StoredQuery("alt.a")
+        assert query == alternatives._StoredQuery("alt.a")
+        assert hash(query) == hash(alternatives._StoredQuery("alt.a"))
+        assert query != alternatives._StoredQuery("alt.b")
+        assert repr(query) == "_StoredQuery('alt.a')"
+
+    def test_albums_query_equality(self):
+        query = alternatives._AlbumsQuery({1, 2})
+        assert query == alternatives._AlbumsQuery([2, 1])
+        assert hash(query) == hash(alternatives._AlbumsQuery([2, 1]))
+        assert query != alternatives._AlbumsQuery({1})
+        assert repr(query) == "_AlbumsQuery([1, 2])"
+
 
 class TestExternalRemovable(TestHelper):
     """Test whether alternatives properly detects ``removable`` collections
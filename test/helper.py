@@ -2,6 +2,7 @@
 
 import os
 import platform
+import queue
 import sys
 from collections.abc import Callable
 from concurrent import futures
@@ -218,22 +219,27 @@ class TestHelper:
 class MockedWorker(alternatives.Worker):
     def __init__(
         self,
-        fn: Callable[[Item], tuple[Item, Path]],
+        fn: Callable[[Item, Path], tuple[Item, Path]],
         max_workers: int | None = None,
+        on_block: Callable[[], None] | None = None,
     ):
         # Don’t call `super().__init__()`. We don’t want to start the
         # ThreadPoolExecutor.
-        self._tasks: set[futures.Future[tuple[Item, Path]]] = set()
         self._fn = fn
+        self._done: queue.SimpleQueue[futures.Future[tuple[Item, Path]]] = (
+            queue.SimpleQueue()
+        )
+        self._pending = 0
 
-    def run(self, item: Item):
+    def run(self, item: Item, dest: Path):
         fut: futures.Future[tuple[Item, Path]] = futures.Future()
-        res = self._fn(item)
+        res = self._fn(item, dest)
         fut.set_result(res)
-        self._tasks.add(fut)
+        self._pending += 1
+        self._done.put(fut)
         return fut
 
-    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+    def shutdown(self, wait: bool = True) -> None:
         pass
 
 